@@ -1,13 +1,37 @@
-import telebot
+import asyncio
+import aiohttp
+import uvicorn
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+from telebot import asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
 import os
+import secrets
+import sys
 import json
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 from dataclasses import dataclass, asdict
-from typing import Dict, List, Tuple, Optional
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Dict, List, Tuple, Optional, TypedDict
 import math
+import time
+
+_START_TIME = time.perf_counter()
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+_prod = math.prod
 
 # ========== ВАШ КАЛЬКУЛЯТОР ==========
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ApartmentParams:
     """Параметры квартиры"""
     area: float                    # площадь в м²
@@ -19,85 +43,121 @@ class ApartmentParams:
     total_floors: int              # всего этажей
     has_balcony: bool              # балкон/лоджия
     heating: str                   # отопление
-    infrastructure: List[str]      # инфраструктура
+    infrastructure: Tuple[str, ...]  # инфраструктура
     view: str = "стандартный"      # вид
     urgency: bool = False          # срочная продажа
+    
+    def __post_init__(self):
+        # Нормализуем параметры один раз при создании; объект неизменяемый,
+        # поэтому присваиваем через object.__setattr__
+        for name in ("district", "house_type", "repair", "heating", "view"):
+            object.__setattr__(self, name, sys.intern(getattr(self, name).lower()))
+        # Повторы в инфраструктуре учитываются один раз
+        object.__setattr__(self, "infrastructure", tuple(sorted(set(self.infrastructure))))
+
+class _ApartmentRequestRequired(TypedDict):
+    area: float
+    district: str
+    build_year: int
+    house_type: str
+    repair: str
+    floor: int
+    total_floors: int
+    has_balcony: bool
+    heating: str
+    infrastructure: List[str]
+
+class ApartmentRequest(_ApartmentRequestRequired, total=False):
+    """JSON-запрос пользователя на расчет (поля ApartmentParams)"""
+    view: str
+    urgency: bool
+
+# ========== КОЭФФИЦИЕНТЫ ==========
+# Неизменяемые таблицы уровня модуля с интернированными ключами:
+# в горячем пути они читаются как локальные имена, без обращения к классу
+def _frozen(table: Dict[str, float]) -> "MappingProxyType[str, float]":
+    return MappingProxyType({sys.intern(key): value for key, value in table.items()})
+
+_BASE_PRICE_PER_M2 = 110000
+
+_COEF_DISTRICT = _frozen({
+    "центр": 1.32, "приморье": 1.25, "калараша": 1.11,
+    "звездная": 1.04, "уральская": 0.96, "барсовая": 0.92,
+    "грознефть": 0.88, "сортировка": 0.85, "кроянское": 0.81,
+    "кадош": 0.86
+})
+
+# Индекс - десятилетие постройки: max(0, min(8, (год - 1940) // 10))
+# до 1950, 1950-1959, 1960-1969, 1970-1979, 1980-1989,
+# 1990-1999, 2000-2009, 2010-2019, 2020+
+_COEF_BUILD_YEAR_BY_DECADE: Tuple[float, ...] = (
+    0.76, 0.82, 0.86, 0.91, 0.97, 1.03, 1.10, 1.19, 1.30
+)
+
+_COEF_REPAIR = _frozen({
+    "евро": 1.26, "косметика": 1.05, "предчистовая": 0.86, "нет": 0.72
+})
+
+_COEF_HOUSE_TYPE = _frozen({
+    "монолит-кирпич": 1.19, "монолитный": 1.15, "кирпич": 1.07,
+    "блочный": 1.02, "панельный": 0.94
+})
+
+_COEF_HEATING = _frozen({
+    "индивид_газ": 1.11, "автономное": 1.06, "центральные": 1.00
+})
+
+_COEF_INFRASTRUCTURE = _frozen({
+    "море_шаг": 0.16, "школа_шаг": 0.07, "садик_шаг": 0.06,
+    "больница_шаг": 0.04, "магазины_шаг": 0.03, "транспорт_10мин": 0.04,
+    "пробки": -0.12, "туристический": 0.08, "спальный": 0.05,
+    "нефтезавод": -0.14
+})
+
+_COEF_VIEW = _frozen({
+    "на море": 1.07, "на город": 1.03, "стандартный": 1.00
+})
+
+# Индекс - номер месяца минус 1
+_COEF_SEASON_BY_MONTH: Tuple[float, ...] = (
+    0.95, 0.95, 1.00, 1.00, 1.10, 1.10, 1.10, 1.10, 1.10, 1.00, 0.95, 0.95
+)
+
+# Сезон определяется по московскому времени (UTC+3, без перехода на летнее),
+# а не по часовому поясу сервера
+_LOCAL_TZ = timezone(timedelta(hours=3))
 
 class PriceCalculator:
     """Калькулятор стоимости недвижимости"""
     
-    BASE_PRICE_PER_M2 = 110000
-    
-    COEF_DISTRICT = {
-        "центр": 1.32, "приморье": 1.25, "калараша": 1.11,
-        "звездная": 1.04, "уральская": 0.96, "барсовая": 0.92,
-        "грознефть": 0.88, "сортировка": 0.85, "кроянское": 0.81,
-        "кадош": 0.86
-    }
-    
-    COEF_BUILD_YEAR = {
-        "2020+": 1.30, "2010-2019": 1.19, "2000-2009": 1.10,
-        "1990-1999": 1.03, "1980-1989": 0.97, "1970-1979": 0.91,
-        "1960-1969": 0.86, "1950-1959": 0.82, "до 1950": 0.76
-    }
-    
-    COEF_REPAIR = {
-        "евро": 1.26, "косметика": 1.05, "предчистовая": 0.86, "нет": 0.72
-    }
+    BASE_PRICE_PER_M2 = _BASE_PRICE_PER_M2
     
-    COEF_HOUSE_TYPE = {
-        "монолит-кирпич": 1.19, "монолитный": 1.15, "кирпич": 1.07,
-        "блочный": 1.02, "панельный": 0.94
-    }
-    
-    COEF_HEATING = {
-        "индивид_газ": 1.11, "автономное": 1.06, "центральные": 1.00
-    }
-    
-    COEF_INFRASTRUCTURE = {
-        "море_шаг": 0.16, "школа_шаг": 0.07, "садик_шаг": 0.06,
-        "больница_шаг": 0.04, "магазины_шаг": 0.03, "транспорт_10мин": 0.04,
-        "пробки": -0.12, "туристический": 0.08, "спальный": 0.05,
-        "нефтезавод": -0.14
-    }
-    
-    COEF_VIEW = {
-        "на море": 1.07, "на город": 1.03, "стандартный": 1.00
-    }
+    COEF_DISTRICT = _COEF_DISTRICT
+    COEF_BUILD_YEAR_BY_DECADE = _COEF_BUILD_YEAR_BY_DECADE
+    COEF_REPAIR = _COEF_REPAIR
+    COEF_HOUSE_TYPE = _COEF_HOUSE_TYPE
+    COEF_HEATING = _COEF_HEATING
+    COEF_INFRASTRUCTURE = _COEF_INFRASTRUCTURE
+    COEF_VIEW = _COEF_VIEW
     
     def __init__(self):
-        self.season_coef = self._get_season_coefficient()
-        
-    def _get_season_coefficient(self) -> float:
-        month = datetime.now().month
-        if 5 <= month <= 9:
-            return 1.10
-        elif 11 <= month <= 2:
-            return 0.95
-        else:
-            return 1.00
+        # (момент истечения по time.time(), коэффициент сезона)
+        self._season: Tuple[float, float] = (0.0, 1.0)
     
-    def _get_year_category(self, year: int) -> str:
-        if year >= 2020:
-            return "2020+"
-        elif 2010 <= year < 2020:
-            return "2010-2019"
-        elif 2000 <= year < 2010:
-            return "2000-2009"
-        elif 1990 <= year < 2000:
-            return "1990-1999"
-        elif 1980 <= year < 1990:
-            return "1980-1989"
-        elif 1970 <= year < 1980:
-            return "1970-1979"
-        elif 1960 <= year < 1970:
-            return "1960-1969"
-        elif 1950 <= year < 1960:
-            return "1950-1959"
-        else:
-            return "до 1950"
+    @property
+    def season_coef(self) -> float:
+        # Пересчитываем раз в сутки - в полночь по местному времени,
+        # чтобы долгоживущий процесс не застревал в прошлом месяце
+        expires_at, value = self._season
+        if time.time() >= expires_at:
+            now = datetime.now(_LOCAL_TZ)
+            value = _COEF_SEASON_BY_MONTH[now.month - 1]
+            midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            self._season = ((midnight + timedelta(days=1)).timestamp(), value)
+        return value
     
-    def _calculate_floor_coefficient(self, floor: int, total_floors: int) -> float:
+    @staticmethod
+    def _calculate_floor_coefficient(floor: int, total_floors: int) -> float:
         if floor == 1:
             floor_num_coef = 0.85
         elif floor == 2:
@@ -131,89 +191,179 @@ class PriceCalculator:
         
         return (floor_num_coef * 0.5 + position_coef * 0.3 + height_coef * 0.2)
     
-    def calculate(self, params: ApartmentParams) -> Dict[str, float]:
+    def calculate(self, params: ApartmentParams) -> Dict[str, Any]:
         if params.area <= 0:
             raise ValueError("Площадь должна быть положительной")
         
-        base_price = self.BASE_PRICE_PER_M2 * params.area
-        
-        district_coef = self.COEF_DISTRICT.get(params.district.lower(), 1.0)
-        
-        year_category = self._get_year_category(params.build_year)
-        year_coef = self.COEF_BUILD_YEAR.get(year_category, 1.0)
-        
-        repair_coef = self.COEF_REPAIR.get(params.repair.lower(), 1.0)
-        
-        house_type_coef = self.COEF_HOUSE_TYPE.get(params.house_type.lower(), 1.0)
-        
-        floor_coef = self._calculate_floor_coefficient(params.floor, params.total_floors)
-        
-        infra_coef = 1.0
-        for infra in params.infrastructure:
-            if infra in self.COEF_INFRASTRUCTURE:
-                infra_coef += self.COEF_INFRASTRUCTURE[infra]
-        
-        balcony_coef = 1.06 if params.has_balcony else 1.0
-        heating_coef = self.COEF_HEATING.get(params.heating.lower(), 1.0)
-        view_coef = self.COEF_VIEW.get(params.view.lower(), 1.0)
-        
-        total_coefficient = (
-            district_coef *
-            year_coef *
-            repair_coef *
-            house_type_coef *
-            floor_coef *
-            infra_coef *
-            balcony_coef *
-            heating_coef *
-            view_coef *
+        # Параметры уже приведены к каноническому виду в ApartmentParams,
+        # поэтому одинаковые запросы попадают в один и тот же ключ кэша
+        result = _calculate_cached(
+            params.area,
+            params.district,
+            params.build_year,
+            params.house_type,
+            params.repair,
+            params.floor,
+            params.total_floors,
+            params.has_balcony,
+            params.heating,
+            params.infrastructure,
+            params.view,
+            params.urgency,
             self.season_coef
         )
-        
-        if params.urgency:
-            total_coefficient *= 0.90
-        
-        final_price = base_price * total_coefficient
-        price_per_m2 = final_price / params.area
-        
-        return {
-            "price_total": round(final_price, 2),
-            "price_per_m2": round(price_per_m2, 2),
-            "base_price": round(base_price, 2),
-            "total_coefficient": round(total_coefficient, 3),
-            "price_breakdown": {
-                "district": round(district_coef, 3),
-                "year": round(year_coef, 3),
-                "repair": round(repair_coef, 3),
-                "house_type": round(house_type_coef, 3),
-                "floor": round(floor_coef, 3),
-                "infrastructure": round(infra_coef, 3),
-                "balcony": round(balcony_coef, 3),
-                "heating": round(heating_coef, 3),
-                "view": round(view_coef, 3),
-                "season": round(self.season_coef, 3)
-            }
+        # Кэшированный результат общий для всех вызовов - отдаём копию
+        return {**result, "price_breakdown": dict(result["price_breakdown"])}
+
+
+# Таблица коэффициентов этажа: _FLOOR_TABLE[всего_этажей - 1][этаж - 1]
+_FLOOR_TABLE_SIZE = 50
+_FLOOR_TABLE: Tuple[Tuple[float, ...], ...] = tuple(
+    tuple(PriceCalculator._calculate_floor_coefficient(f, t)
+          for f in range(1, _FLOOR_TABLE_SIZE + 1))
+    for t in range(1, _FLOOR_TABLE_SIZE + 1)
+)
+
+
+def _combine(district: float, year: float, repair: float, house: float,
+             floor: float, infra: float, balcony: float, heating: float,
+             view: float, season: float, urgency: bool) -> float:
+    """Итоговый коэффициент: только арифметика над готовыми числами"""
+    total = _prod((district, year, repair, house, floor,
+                   infra, balcony, heating, view, season))
+    if urgency:
+        total *= 0.90
+    return total
+
+
+@lru_cache(maxsize=4096)
+def _calculate_cached(area: float, district: str, build_year: int, house_type: str,
+                      repair: str, floor: int, total_floors: int, has_balcony: bool,
+                      heating: str, infrastructure: Tuple[str, ...], view: str,
+                      urgency: bool, season_coef: float) -> Dict[str, Any]:
+    """Расчёт стоимости по нормализованным параметрам (с кэшем)"""
+    district_get = _COEF_DISTRICT.get
+    repair_get = _COEF_REPAIR.get
+    house_type_get = _COEF_HOUSE_TYPE.get
+    heating_get = _COEF_HEATING.get
+    view_get = _COEF_VIEW.get
+    infra_get = _COEF_INFRASTRUCTURE.get
+    
+    base_price = _BASE_PRICE_PER_M2 * area
+    
+    district_coef = district_get(district, 1.0)
+    
+    # int(): год может прийти из JSON как float (2018.0)
+    year_coef = _COEF_BUILD_YEAR_BY_DECADE[max(0, min(8, int((build_year - 1940) // 10)))]
+    
+    repair_coef = repair_get(repair, 1.0)
+    
+    house_type_coef = house_type_get(house_type, 1.0)
+    
+    # Таблица индексируется только целыми; float из JSON (5.0) идет
+    # через исходную функцию
+    if (type(floor) is int and type(total_floors) is int
+            and 1 <= floor <= _FLOOR_TABLE_SIZE and 1 <= total_floors <= _FLOOR_TABLE_SIZE):
+        floor_coef = _FLOOR_TABLE[total_floors - 1][floor - 1]
+    else:
+        floor_coef = PriceCalculator._calculate_floor_coefficient(floor, total_floors)
+    
+    infra_coef = sum((infra_get(infra, 0.0) for infra in infrastructure), 1.0)
+    
+    balcony_coef = 1.06 if has_balcony else 1.0
+    heating_coef = heating_get(heating, 1.0)
+    view_coef = view_get(view, 1.0)
+    
+    total_coefficient = _combine(
+        district_coef,
+        year_coef,
+        repair_coef,
+        house_type_coef,
+        floor_coef,
+        infra_coef,
+        balcony_coef,
+        heating_coef,
+        view_coef,
+        season_coef,
+        urgency
+    )
+    
+    final_price = base_price * total_coefficient
+    price_per_m2 = final_price / area
+    
+    return {
+        "price_total": round(final_price, 2),
+        "price_per_m2": round(price_per_m2, 2),
+        "base_price": round(base_price, 2),
+        "total_coefficient": round(total_coefficient, 3),
+        "price_breakdown": {
+            "district": round(district_coef, 3),
+            "year": round(year_coef, 3),
+            "repair": round(repair_coef, 3),
+            "house_type": round(house_type_coef, 3),
+            "floor": round(floor_coef, 3),
+            "infrastructure": round(infra_coef, 3),
+            "balcony": round(balcony_coef, 3),
+            "heating": round(heating_coef, 3),
+            "view": round(view_coef, 3),
+            "season": round(season_coef, 3)
         }
+    }
 
 # ========== TELEGRAM БОТ ==========
-# Получаем токен из переменных окружения (Render добавит)
-TOKEN = os.getenv('7983712081:AAHhDZcFrKCFcXPcdFDg6PM_Rpl5mhAxPOE')
+# Получаем токен из переменных окружения (задается в настройках Render)
+TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 if not TOKEN:
     print("ОШИБКА: Токен не найден!")
-    print("Добавьте переменную 7983712081:AAHhDZcFrKCFcXPcdFDg6PM_Rpl5mhAxPOE в Render")
-    print("Текущие переменные окружения:", os.environ.keys())
+    print("Добавьте переменную окружения TELEGRAM_BOT_TOKEN в Render")
     exit(1)
 
-bot = telebot.TeleBot(TOKEN)
+class _PooledSessionManager(asyncio_helper.SessionManager):
+    """Общая HTTP-сессия с пулом keep-alive соединений к api.telegram.org"""
+    
+    async def create_session(self):
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+            limit=100,
+            keepalive_timeout=75,
+            ssl=self.ssl_context
+        ))
+        return self.session
+
+asyncio_helper.session_manager = _PooledSessionManager()
+
+bot = AsyncTeleBot(TOKEN)
 calculator = PriceCalculator()
 
-# Словарь для хранения состояний пользователей
-user_states = {}
+# Состояния пользователей; самые давние сессии вытесняются при переполнении
+MAX_USER_STATES = 10_000
+user_states: "OrderedDict[int, dict]" = OrderedDict()
 
-# ========== КОМАНДЫ БОТА ==========
-@bot.message_handler(commands=['start'])
-def send_welcome(message):
-    welcome_text = ""
+def _set_state(user_id: int, state: dict):
+    user_states[user_id] = state
+    user_states.move_to_end(user_id)
+    if len(user_states) > MAX_USER_STATES:
+        user_states.popitem(last=False)
+
+# ========== ТЕКСТЫ СООБЩЕНИЙ ==========
+# Собираем один раз при импорте, а не в каждом обработчике
+_EXAMPLE_JSON = """```json
+{
+  "area": 45.0,
+  "district": "центр",
+  "build_year": 2018,
+  "house_type": "монолитный",
+  "repair": "евро",
+  "floor": 5,
+  "total_floors": 10,
+  "has_balcony": true,
+  "heating": "индивид_газ",
+  "infrastructure": ["море_шаг", "школа_шаг"],
+  "view": "на море",
+  "urgency": false
+}
+```"""
+
+_WELCOME_TEXT = sys.intern("""
  *ОЦЕНЩИК НЕДВИЖИМОСТИ*
 
 Я помогу оценить стоимость квартиры в вашем городе на основе:
@@ -234,35 +384,162 @@ def send_welcome(message):
 /infra - список инфраструктуры
 
 *Для расчета используйте команду /calculate*
-""
-    bot.reply_to(message, welcome_text, parse_mode='Markdown')
+""")
 
-@bot.message_handler(commands=['help'])
-def send_help(message):
-    help_text = ""
+_HELP_TEXT = sys.intern(f"""
  *КАК ПОЛЬЗОВАТЬСЯ БОТОМ:*
 
 1. Начните с команды /calculate
 2. Будет предложено ввести параметры в формате JSON
 3. Пример формата:
-```json
-{
-  "area": 45.0,
-  "district": "центр",
-  "build_year": 2018,
-  "house_type": "монолитный",
-  "repair": "евро",
-  "floor": 5,
-  "total_floors": 10,
-  "has_balcony": true,
-  "heating": "индивид_газ",
-  "infrastructure": ["море_шаг", "школа_шаг"],
-  "view": "на море",
-  "urgency": false
+{_EXAMPLE_JSON}
+
+Список районов - /districts
+Список инфраструктуры - /infra
+""")
+
+_EXAMPLE_TEXT = sys.intern(f"""
+ *ПРИМЕР РАСЧЕТА*
+
+Отправьте /calculate, а затем сообщение:
+{_EXAMPLE_JSON}
+""")
+
+_CALCULATE_TEXT = sys.intern(f"""
+Отправьте параметры квартиры одним сообщением в формате JSON:
+{_EXAMPLE_JSON}
+""")
+
+_BREAKDOWN_LABELS = {
+    "district": "Район", "year": "Год постройки", "repair": "Ремонт",
+    "house_type": "Тип дома", "floor": "Этаж", "infrastructure": "Инфраструктура",
+    "balcony": "Балкон", "heating": "Отопление", "view": "Вид", "season": "Сезон"
 }
 
-  
+_DISTRICTS_TEXT = sys.intern(
+    " *ДОСТУПНЫЕ РАЙОНЫ:*\n\n" +
+    "\n".join(f"• `{name}` - x{coef}"
+              for name, coef in PriceCalculator.COEF_DISTRICT.items())
+)
+
+_INFRA_TEXT = sys.intern(
+    " *ИНФРАСТРУКТУРА:*\n\n" +
+    "\n".join(f"• `{name}` - {coef:+.0%}"
+              for name, coef in PriceCalculator.COEF_INFRASTRUCTURE.items())
+)
+
+# ========== КОМАНДЫ БОТА ==========
+@bot.message_handler(commands=['start'])
+async def send_welcome(message):
+    await bot.reply_to(message, _WELCOME_TEXT, parse_mode='Markdown')
+
+@bot.message_handler(commands=['help'])
+async def send_help(message):
+    await bot.reply_to(message, _HELP_TEXT, parse_mode='Markdown')
+
+@bot.message_handler(commands=['example'])
+async def send_example(message):
+    await bot.reply_to(message, _EXAMPLE_TEXT, parse_mode='Markdown')
+
+@bot.message_handler(commands=['districts'])
+async def send_districts(message):
+    await bot.reply_to(message, _DISTRICTS_TEXT, parse_mode='Markdown')
+
+@bot.message_handler(commands=['infra'])
+async def send_infra(message):
+    await bot.reply_to(message, _INFRA_TEXT, parse_mode='Markdown')
+
+@bot.message_handler(commands=['calculate'])
+async def start_calculate(message):
+    _set_state(message.from_user.id, {"step": "awaiting_params"})
+    await bot.reply_to(message, _CALCULATE_TEXT, parse_mode='Markdown')
+
+def _format_price(value: float) -> str:
+    return f"{value:,.0f}".replace(",", " ")
+
+def _format_result(result: Dict[str, Any]) -> str:
+    lines = [
+        " *РЕЗУЛЬТАТ ОЦЕНКИ*",
+        "",
+        f"Стоимость: *{_format_price(result['price_total'])} ₽*",
+        f"За м²: {_format_price(result['price_per_m2'])} ₽",
+        f"Базовая стоимость: {_format_price(result['base_price'])} ₽",
+        f"Итоговый коэффициент: x{result['total_coefficient']}",
+        "",
+        "*Коэффициенты:*"
+    ]
+    for key, coef in result["price_breakdown"].items():
+        lines.append(f"• {_BREAKDOWN_LABELS[key]}: x{coef}")
+    return "\n".join(lines)
+
+@bot.message_handler(func=lambda message: user_states.get(message.from_user.id, {}).get("step") == "awaiting_params")
+async def handle_params(message):
+    try:
+        data: ApartmentRequest = _json_loads(message.text)
+        params = ApartmentParams(**data)
+        result = calculator.calculate(params)
+    except (ValueError, TypeError, AttributeError) as e:
+        # Текст ошибки может содержать символы разметки - шлем без Markdown
+        await bot.reply_to(message, f"Ошибка в параметрах: {e}\nПопробуйте еще раз или смотрите /help")
+        return
+    
+    user_states.pop(message.from_user.id, None)
+    await bot.reply_to(message, _format_result(result), parse_mode='Markdown')
+
+# ========== ЗАПУСК ==========
+# Если известен публичный адрес (Render задает RENDER_EXTERNAL_URL),
+# Telegram сам присылает обновления на webhook, иначе - long polling
+PUBLIC_URL = os.getenv('PUBLIC_URL') or os.getenv('RENDER_EXTERNAL_URL')
+WEBHOOK_PATH = '/tg'
+# Секрет есть всегда: без него POST /tg открыт любому. Случайного токена на
+# процесс достаточно - lifespan заново регистрирует webhook при каждом старте
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+
+async def telegram_webhook(request: Request) -> Response:
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not secrets.compare_digest(token, WEBHOOK_SECRET):
+        return Response(status_code=403)
+    try:
+        data = _json_loads(await request.body())
+        update = types.Update.de_json(data) if isinstance(data, dict) else None
+    except (ValueError, KeyError):
+        update = None
+    if update is None:
+        # Битое тело не исправится повтором - не даем Telegram его переслать
+        return Response(status_code=400)
+    await bot.process_new_updates([update])
+    return Response()
+
+async def health(request: Request) -> Response:
+    return Response("ok")
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    await bot.remove_webhook()
+    await bot.set_webhook(url=f"{PUBLIC_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+    _log_startup("webhook")
+    yield
+    await bot.close_session()
 
+def _log_startup(mode: str):
+    print(f"Бот запущен ({mode}) за {time.perf_counter() - _START_TIME:.2f} с")
 
+async def _run_polling():
+    # Webhook, оставшийся после запуска на Render, блокирует getUpdates (409)
+    await bot.delete_webhook()
+    _log_startup("polling")
+    await bot.polling(non_stop=True)
 
+app = Starlette(
+    routes=[
+        Route(WEBHOOK_PATH, telegram_webhook, methods=['POST']),
+        Route('/', health)
+    ],
+    lifespan=lifespan
+)
 
+if __name__ == '__main__':
+    if PUBLIC_URL:
+        uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', '8000')))
+    else:
+        asyncio.run(_run_polling())